@@ -1,14 +1,37 @@
-import os
 import json
-import requests
+import argparse
+import httpx
+import msgspec
 import pandas as pd
 import time
+import logging
+import shelve
+import functools
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+import httplib2
 from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
 from google.oauth2 import service_account
+from google_auth_httplib2 import AuthorizedHttp
 from pathlib import Path
 
 
+logger = logging.getLogger(__name__)
+
+# 일별 데이터 열 순서 (스프레드시트 열 순서와 동일)
+COLUMN_KEYS = (
+    'date', 'uniques', 'pageViews', 'requests', 'cachedRequests',
+    'cacheRatio', 'bytes', 'cachedBytes', 'threats'
+)
+
+# 스프레드시트 헤더 (COLUMN_KEYS 순서)
+HEADERS_KR = [
+    '날짜', '고유 방문자', '페이지뷰', '총 요청수', '캐시된 요청수',
+    '캐시 비율(%)', '총 데이터', '캐시된 데이터', '위협 감지'
+]
+
+
 class ConfigHandler:
     def __init__(self, config_path="config.json"):
         self.config_path = config_path
@@ -45,27 +68,87 @@ class ConfigHandler:
                     raise Exception(f"설정 파일의 '{section}.{field}' 값이 비어있습니다.")
 
 
+# GraphQL 응답 구조 (msgspec으로 바로 디코딩 및 검증)
+class Dimensions(msgspec.Struct):
+    date: str
+
+
+class Sum(msgspec.Struct):
+    bytes: int = 0
+    cachedBytes: int = 0
+    requests: int = 0
+    cachedRequests: int = 0
+    pageViews: int = 0
+    threats: int = 0
+
+
+class Uniq(msgspec.Struct):
+    uniques: int = 0
+
+
+class Day(msgspec.Struct):
+    dimensions: Dimensions
+    sum: Sum
+    uniq: Uniq
+
+
+# GraphQL은 실패한 필드 위치에 null을 반환하므로 errors 확인 전까지 null을 허용
+class Zone(msgspec.Struct):
+    httpRequests1dGroups: list[Day] | None = None
+
+
+class Viewer(msgspec.Struct):
+    zones: list[Zone] | None = None
+
+
+class ResponseData(msgspec.Struct):
+    viewer: Viewer | None = None
+
+
+class GraphQLResponse(msgspec.Struct):
+    data: ResponseData | None = None
+    errors: list | None = None
+
+
 class CloudflareAnalytics:
+    MAX_ATTEMPTS = 3  # API 요청 최대 시도 횟수
+    TIMEOUT = httpx.Timeout(30.0, connect=5.0)
+
     def __init__(self, config):
         self.headers = {
             'Authorization': f'Bearer {config["cloudflare"]["api_token"]}',
-            'Content-Type': 'application/json'
+            'Content-Type': 'application/json',
+            'Accept-Encoding': 'br, gzip'
         }
         self.zone_id = config["cloudflare"]["zone_id"]
         self.base_url = 'https://api.cloudflare.com/client/v4'
         self.graphql_url = 'https://api.cloudflare.com/client/v4/graphql'
 
-    def get_last_30days_analytics(self):
-        """최근 30일간의 일별 Analytics 데이터 수집"""
-        end_date = datetime.now()
-        start_date = end_date - timedelta(days=30)
-
-        # 날짜 형식 변환
-        start_date_str = start_date.strftime('%Y-%m-%d')
-        end_date_str = end_date.strftime('%Y-%m-%d')
-
-        print(f"\n수집 기간: {start_date_str} ~ {end_date_str}")
-
+        # 연결 재사용을 위한 HTTP/2 클라이언트 (keep-alive)
+        transport = httpx.HTTPTransport(
+            http2=True,
+            limits=httpx.Limits(max_connections=4, keepalive_expiry=60)
+        )
+        self.client = httpx.Client(
+            transport=transport,
+            headers=self.headers,
+            timeout=self.TIMEOUT
+        )
+
+        # 확정된 일별 응답 캐시 ("zone_id:날짜" -> Day, 데이터가 없는 날은 None)
+        # 사용하는 스레드에서 열고 닫도록 경로만 보관 (dbm.sqlite3는 스레드 간 공유 불가)
+        self.cache_path = str(Path(__file__).parent / 'cf_cache.db')
+
+    def close(self):
+        """HTTP 클라이언트 연결 종료"""
+        self.client.close()
+
+    def cache_key(self, date_str):
+        """일별 응답 캐시 키"""
+        return f"{self.zone_id}:{date_str}"
+
+    def fetch_daily_groups(self, start_date_str, end_date_str):
+        """GraphQL API로 기간 내 일별 원본 데이터 조회"""
         query = """
         query AnalyticsData($zoneTag: String!, $start: Date!, $end: Date!) {
           viewer {
@@ -100,224 +183,393 @@ class CloudflareAnalytics:
             "end": end_date_str
         }
 
+        for attempt in range(self.MAX_ATTEMPTS):
+            is_last_attempt = attempt == self.MAX_ATTEMPTS - 1
+            try:
+                response = self.client.post(
+                    self.graphql_url,
+                    json={"query": query, "variables": variables}
+                )
+            except httpx.TransportError as e:
+                if is_last_attempt:
+                    raise
+                delay = 2 ** attempt
+                logger.warning(f"API 연결 오류: {str(e)} ({delay}초 후 재시도)")
+                time.sleep(delay)
+                continue
+
+            # 요청 한도 초과 시 Retry-After 만큼 대기 후 재시도
+            if response.status_code == 429 and not is_last_attempt:
+                try:
+                    delay = int(response.headers.get('Retry-After', '30'))
+                except ValueError:
+                    delay = 30
+                logger.warning(f"API 요청 한도 초과 ({delay}초 후 재시도)")
+                time.sleep(delay)
+                continue
+            break
+
+        if response.status_code != 200:
+            logger.error(f"API 응답 상태 코드: {response.status_code}")
+            logger.error(f"응답 내용: {response.text}")
+            raise Exception(f"API 요청 실패: {response.status_code}")
+
         try:
-            response = requests.post(
-                self.graphql_url,
-                headers=self.headers,
-                json={"query": query, "variables": variables}
-            )
+            data = msgspec.json.decode(response.content, type=GraphQLResponse)
+        except msgspec.ValidationError as e:
+            raise Exception(f"응답 데이터 형식이 잘못되었습니다: {str(e)}")
+
+        # 데이터 내용 확인보다 GraphQL 에러를 먼저 확인
+        if data.errors:
+            logger.error(f"GraphQL 응답: {msgspec.json.format(response.content, indent=2).decode()}")
+            raise Exception(f"GraphQL 에러: {data.errors}")
+
+        if data.data is None or data.data.viewer is None or not data.data.viewer.zones:
+            raise Exception("응답 데이터에 zones 정보가 없습니다.")
 
-            if response.status_code != 200:
-                print(f"API 응답 상태 코드: {response.status_code}")
-                print(f"응답 내용: {response.text}")
-                raise Exception(f"API 요청 실패: {response.status_code}")
+        return data.data.viewer.zones[0].httpRequests1dGroups or []
+
+    def get_last_30days_analytics(self):
+        """최근 30일간의 일별 Analytics 데이터 수집 (DataFrame 반환)"""
+        end_date = datetime.now()
+        start_date = end_date - timedelta(days=30)
 
-            data = response.json()
+        # 날짜 형식 변환
+        start_date_str = start_date.strftime('%Y-%m-%d')
+        end_date_str = end_date.strftime('%Y-%m-%d')
 
-            if 'errors' in data and data['errors']:
-                print(f"GraphQL 응답: {json.dumps(data, indent=2)}")
-                raise Exception(f"GraphQL 에러: {data['errors']}")
+        # 어제 이전 날짜의 데이터만 확정된 것으로 보고 캐시
+        cacheable_before = (end_date - timedelta(days=1)).strftime('%Y-%m-%d')
 
-            zones_data = data.get('data', {}).get('viewer', {}).get('zones', [])
-            if not zones_data:
-                raise Exception("응답 데이터에 zones 정보가 없습니다.")
+        logger.info(f"수집 기간: {start_date_str} ~ {end_date_str}")
+
+        try:
+            dates = [
+                (start_date + timedelta(days=offset)).strftime('%Y-%m-%d')
+                for offset in range((end_date - start_date).days + 1)
+            ]
+
+            with shelve.open(self.cache_path) as cache:
+                missing_dates = [d for d in dates if self.cache_key(d) not in cache]
+
+                requests_data = []
+                for date_str in dates:
+                    if date_str not in missing_dates:
+                        record = cache[self.cache_key(date_str)]
+                        if record is not None:
+                            requests_data.append(record)
+
+                # 캐시에 없는 날짜만 API로 조회
+                if missing_dates:
+                    logger.info(f"API 조회 기간: {missing_dates[0]} ~ {missing_dates[-1]} "
+                                f"(캐시 사용: {len(dates) - len(missing_dates)}일)")
+                    fetched = self.fetch_daily_groups(missing_dates[0], missing_dates[-1])
+                    fetched_by_date = {day.dimensions.date: day for day in fetched}
+
+                    for date_str in missing_dates:
+                        record = fetched_by_date.get(date_str)
+                        if record is not None:
+                            requests_data.append(record)
+                        if date_str < cacheable_before:
+                            cache[self.cache_key(date_str)] = record
+
+                # 수집 기간을 벗어난 이 zone의 캐시 항목 삭제
+                key_prefix = self.cache_key('')
+                expired_keys = [
+                    key for key in cache.keys()
+                    if key.startswith(key_prefix) and key[len(key_prefix):] < start_date_str
+                ]
+                for key in expired_keys:
+                    del cache[key]
 
-            requests_data = zones_data[0].get('httpRequests1dGroups', [])
             if not requests_data:
-                print("주의: 지정된 기간에 데이터가 없습니다.")
+                logger.warning("주의: 지정된 기간에 데이터가 없습니다.")
                 return None
 
-            # 일별 데이터 처리
-            daily_data = []
-
-            for day in requests_data:
-                dimensions = day['dimensions']
-                sum_data = day['sum']
-                uniq_data = day['uniq']
-
-                # 일별 데이터 생성
-                daily_record = {
-                    '날짜': dimensions['date'],
-                    '고유 방문자': uniq_data.get('uniques', 0),
-                    '페이지뷰': sum_data.get('pageViews', 0),
-                    '총 요청수': sum_data.get('requests', 0),
-                    '캐시된 요청수': sum_data.get('cachedRequests', 0),
-                    '총 데이터(bytes)': sum_data.get('bytes', 0),
-                    '캐시된 데이터(bytes)': sum_data.get('cachedBytes', 0),
-                    '위협 감지': sum_data.get('threats', 0)
-                }
-
-                # 캐시 비율 계산
-                total_requests = daily_record['총 요청수']
-                if total_requests > 0:
-                    cache_ratio = (daily_record['캐시된 요청수'] / total_requests) * 100
-                    daily_record['캐시 비율(%)'] = round(cache_ratio, 2)
-                else:
-                    daily_record['캐시 비율(%)'] = 0
+            # 일별 데이터 처리 (디코딩된 응답을 한 번에 DataFrame으로 변환)
+            daily_data = pd.DataFrame(
+                [
+                    (day.dimensions.date, day.uniq.uniques, day.sum.pageViews,
+                     day.sum.requests, day.sum.cachedRequests, day.sum.bytes,
+                     day.sum.cachedBytes, day.sum.threats)
+                    for day in requests_data
+                ],
+                columns=['date', 'uniques', 'pageViews', 'requests', 'cachedRequests',
+                         'bytes', 'cachedBytes', 'threats']
+            )
 
-                daily_data.append(daily_record)
+            # 캐시 비율 계산
+            cache_ratio = (daily_data['cachedRequests'] / daily_data['requests'] * 100).round(2)
+            daily_data['cacheRatio'] = cache_ratio.where(daily_data['requests'] > 0, 0)
 
-            # 날짜순으로 정렬
-            daily_data.sort(key=lambda x: x['날짜'], reverse=True)  # 최신 날짜가 위로 오도록 정렬
+            # 열 순서를 COLUMN_KEYS에 맞추고 날짜순으로 정렬
+            daily_data = daily_data[list(COLUMN_KEYS)]
+            daily_data = daily_data.sort_values('date', ascending=False, ignore_index=True)  # 최신 날짜가 위로 오도록 정렬
 
             return daily_data
 
         except Exception as e:
-            print(f"데이터 수집 중 오류 발생: {str(e)}")
+            logger.error(f"데이터 수집 중 오류 발생: {str(e)}")
             raise
 
 
+@functools.lru_cache(maxsize=None)
+def load_credentials(credentials_path, scopes):
+    """서비스 계정 인증 정보 로드 (프로세스 내에서 재사용, 만료 시 자동 갱신)"""
+    return service_account.Credentials.from_service_account_file(
+        credentials_path, scopes=list(scopes))
+
+
 class GoogleSheetHandler:
-    SCOPES = ['https://www.googleapis.com/auth/spreadsheets']
+    SCOPES = ('https://www.googleapis.com/auth/spreadsheets',)
+    NUM_RETRIES = 3  # 재시도 횟수 (조회: 429/5xx/연결 오류, 쓰기: 429만)
+    TIMEOUT = 35  # 요청당 최대 대기 시간(초)
+    BYTE_UNITS = ['B', 'KB', 'MB', 'GB', 'TB', 'PB']
 
-    def __init__(self, config):
+    def __init__(self, config, refresh_state=False):
         credentials_path = config['google_sheets']['credentials_file']
         self.spreadsheet_id = config['google_sheets']['spreadsheet_id']
         self.sheet_name = config['google_sheets']['sheet_name']
 
         try:
-            self.credentials = service_account.Credentials.from_service_account_file(
-                credentials_path, scopes=self.SCOPES)
-            self.service = build('sheets', 'v4', credentials=self.credentials)
+            self.credentials = load_credentials(str(credentials_path), self.SCOPES)
+            # 패키지에 포함된 discovery 문서 사용 (네트워크 조회 생략)
+            http = AuthorizedHttp(self.credentials, http=httplib2.Http(timeout=self.TIMEOUT))
+            self.service = build('sheets', 'v4', http=http,
+                                 cache_discovery=False, static_discovery=True)
             self.sheet = self.service.spreadsheets()
         except Exception as e:
             raise Exception(f"Google Sheets 인증 실패: {str(e)}")
 
+        # 시트 ID는 변하지 않으므로 한 번만 조회
+        self.sheet_id = self.get_sheet_id()
+
+        # 이미 기록한 날짜 목록 (로컬 상태 파일, 없으면 None)
+        self.state_path = Path('~/.cf_sheet_state.json').expanduser()
+        self._written_dates = None if refresh_state else self.load_state()
+
     def format_bytes(self, bytes_value):
         """바이트 값을 읽기 쉬운 형식으로 변환"""
-        for unit in ['B', 'KB', 'MB', 'GB', 'TB']:
-            if bytes_value < 1024.0:
-                return f"{bytes_value:.2f} {unit}"
-            bytes_value /= 1024.0
-        return f"{bytes_value:.2f} PB"
+        if bytes_value <= 0:
+            return "0.00 B"
+        # 1024 단위 지수를 비트 길이로 바로 계산
+        unit_index = max(0, min((int(bytes_value).bit_length() - 1) // 10, len(self.BYTE_UNITS) - 1))
+        return f"{bytes_value / (1 << (10 * unit_index)):.2f} {self.BYTE_UNITS[unit_index]}"
+
+    def to_cell(self, value):
+        """셀 값을 appendCells 요청의 CellData 형식으로 변환"""
+        if isinstance(value, str):
+            if value.startswith('='):
+                return {'userEnteredValue': {'formulaValue': value}}
+            return {'userEnteredValue': {'stringValue': value}}
+        return {'userEnteredValue': {'numberValue': value}}
+
+    def load_state(self):
+        """로컬 상태 파일에서 기록된 날짜 목록 로드"""
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+        # 다른 스프레드시트/시트의 상태는 사용하지 않음
+        if (state.get('spreadsheet_id') != self.spreadsheet_id
+                or state.get('sheet_name') != self.sheet_name):
+            return None
+        return set(state.get('dates', []))
+
+    def save_state(self):
+        """기록된 날짜 목록을 로컬 상태 파일에 저장 (임시 파일 교체로 원자적 저장)"""
+        state = {
+            'spreadsheet_id': self.spreadsheet_id,
+            'sheet_name': self.sheet_name,
+            'dates': sorted(self._written_dates)
+        }
+        try:
+            tmp_path = self.state_path.with_name(self.state_path.name + '.tmp')
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(state, f, ensure_ascii=False)
+            tmp_path.replace(self.state_path)
+        except OSError as e:
+            logger.warning(f"상태 파일 저장 중 오류 발생: {str(e)}")
+
+    def clear_state(self):
+        """로컬 상태 초기화 (다음 추가 시 스프레드시트에서 날짜 목록 재조회)"""
+        self._written_dates = None
+        try:
+            self.state_path.unlink(missing_ok=True)
+        except OSError as e:
+            logger.warning(f"상태 파일 삭제 중 오류 발생: {str(e)}")
 
     def get_existing_data(self):
-        """스프레드시트의 현재 데이터 조회"""
+        """스프레드시트의 날짜 열(A열) 조회"""
         try:
             result = self.sheet.values().get(
                 spreadsheetId=self.spreadsheet_id,
-                range=f'{self.sheet_name}!A:J'
-            ).execute()
+                range=f'{self.sheet_name}!A:A',
+                majorDimension='COLUMNS'
+            ).execute(num_retries=self.NUM_RETRIES)
 
-            return result.get('values', [])
+            return result.get('values', [[]])[0]
         except Exception as e:
-            print(f"기존 데이터 조회 중 오류 발생: {str(e)}")
-            return []
+            logger.warning(f"기존 데이터 조회 중 오류 발생: {str(e)}")
+            return None
 
     def append_daily_data(self, daily_data):
-        """일별 데이터를 스프레드시트에 추가"""
+        """일별 데이터(COLUMN_KEYS 순서의 튜플 목록)를 스프레드시트에 추가"""
         if not daily_data:
-            print("추가할 데이터가 없습니다.")
+            logger.info("추가할 데이터가 없습니다.")
             return None
 
         try:
-            # 기존 데이터 조회
-            existing_data = self.get_existing_data()
+            if self._written_dates is None:
+                # 로컬 상태가 없는 경우에만 스프레드시트의 날짜 열 조회
+                existing_dates_column = self.get_existing_data()
 
-            # 헤더가 없는 경우 헤더 추가
-            headers = [
-                '날짜', '고유 방문자', '페이지뷰', '총 요청수', '캐시된 요청수',
-                '캐시 비율(%)', '총 데이터', '캐시된 데이터', '위협 감지'
-            ]
+                # 조회 실패 시 중복 추가를 막기 위해 중단 (main에서 재시도)
+                if existing_dates_column is None:
+                    raise Exception("기존 날짜 목록을 조회할 수 없어 데이터 추가를 중단합니다.")
+
+                # 헤더가 없는 경우 헤더 추가
+                if not existing_dates_column:
+                    existing_dates_column = [HEADERS_KR[0]]
 
-            if not existing_data:
-                existing_data = [headers]
+                # 기존 데이터의 날짜 목록 생성 (첫 행은 헤더)
+                self._written_dates = set(existing_dates_column[1:])
+                self.save_state()
 
-            # 기존 데이터의 날짜 목록 생성
-            existing_dates = set()
-            if len(existing_data) > 1:  # 헤더를 제외한 데이터가 있는 경우
-                existing_dates = {row[0] for row in existing_data[1:]}
+            existing_dates = self._written_dates
 
             # 날짜순으로 정렬 (오래된 날짜가 위로)
-            daily_data.sort(key=lambda x: x['날짜'])
+            daily_data.sort(key=lambda x: x[0])
 
             # 새로운 데이터만 필터링
             new_rows = []
             duplicate_count = 0
 
             for day in daily_data:
-                # 날짜 형식 변환: YYYY-MM-DD를 DD/MM/YYYY 형식으로 변환
-                date_obj = datetime.strptime(day['날짜'], '%Y-%m-%d')
-                formatted_date = f"=DATE({date_obj.year}, {date_obj.month}, {date_obj.day})"
+                (date_str, uniques, page_views, total_requests, cached_requests,
+                 cache_ratio, total_bytes, cached_bytes, threats) = day
+
+                # 날짜 형식 변환: YYYY-MM-DD를 DATE 수식으로 변환 (strptime 없이 분리)
+                year, month, day_of_month = date_str.split('-')
+                formatted_date = f"=DATE({year}, {int(month)}, {int(day_of_month)})"
 
-                if day['날짜'] not in existing_dates:
+                if date_str not in existing_dates:
                     row = [
                         formatted_date,  # 날짜 형식 지정
-                        day['고유 방문자'],
-                        day['페이지뷰'],
-                        day['총 요청수'],
-                        day['캐시된 요청수'],
-                        day['캐시 비율(%)'],
-                        self.format_bytes(day['총 데이터(bytes)']),
-                        self.format_bytes(day['캐시된 데이터(bytes)']),
-                        day['위협 감지']
+                        uniques,
+                        page_views,
+                        total_requests,
+                        cached_requests,
+                        cache_ratio,
+                        total_bytes,  # 바이트 단위 정수 (표시 형식은 시트에서 지정)
+                        cached_bytes,
+                        threats
                     ]
                     new_rows.append(row)
                 else:
                     duplicate_count += 1
 
             if not new_rows:
-                print("추가할 새로운 데이터가 없습니다.")
+                logger.info("추가할 새로운 데이터가 없습니다.")
                 if duplicate_count > 0:
-                    print(f"중복된 데이터: {duplicate_count}개")
+                    logger.info(f"중복된 데이터: {duplicate_count}개")
                 return None
 
-            # 새 데이터 추가
-            result = self.sheet.values().append(
-                spreadsheetId=self.spreadsheet_id,
-                range=f'{self.sheet_name}!A1',
-                valueInputOption='USER_ENTERED',  # 수식을 해석하도록 설정
-                insertDataOption='INSERT_ROWS',
-                body={'values': new_rows}
-            ).execute()
-
-            # 날짜 열 서식 지정 (선택사항)
-            sheet_id = self.get_sheet_id()
-            if sheet_id:
-                date_format_request = {
-                    'requests': [
-                        {
-                            'repeatCell': {
-                                'range': {
-                                    'sheetId': sheet_id,
-                                    'startColumnIndex': 0,
-                                    'endColumnIndex': 1,
-                                    'startRowIndex': 1  # 헤더 제외
-                                },
-                                'cell': {
-                                    'userEnteredFormat': {
-                                        'numberFormat': {
-                                            'type': 'DATE',
-                                            'pattern': 'yyyy-mm-dd'
-                                        }
-                                    }
-                                },
-                                'fields': 'userEnteredFormat.numberFormat'
+            if self.sheet_id is None:
+                raise Exception(f"시트를 찾을 수 없습니다: {self.sheet_name}")
+
+            # 새 데이터 추가와 날짜/데이터 열 서식 지정을 한 번의 요청으로 처리
+            batch_requests = [
+                {
+                    'appendCells': {
+                        'sheetId': self.sheet_id,
+                        'rows': [
+                            {'values': [self.to_cell(value) for value in row]}
+                            for row in new_rows
+                        ],
+                        'fields': 'userEnteredValue'
+                    }
+                },
+                {
+                    'repeatCell': {
+                        'range': {
+                            'sheetId': self.sheet_id,
+                            'startColumnIndex': 0,
+                            'endColumnIndex': 1,
+                            'startRowIndex': 1  # 헤더 제외
+                        },
+                        'cell': {
+                            'userEnteredFormat': {
+                                'numberFormat': {
+                                    'type': 'DATE',
+                                    'pattern': 'yyyy-mm-dd'
+                                }
                             }
-                        }
-                    ]
+                        },
+                        'fields': 'userEnteredFormat.numberFormat'
+                    }
+                },
+                {
+                    'repeatCell': {
+                        'range': {
+                            'sheetId': self.sheet_id,
+                            'startColumnIndex': 6,  # 총 데이터, 캐시된 데이터
+                            'endColumnIndex': 8,
+                            'startRowIndex': 1  # 헤더 제외
+                        },
+                        'cell': {
+                            'userEnteredFormat': {
+                                'numberFormat': {
+                                    'type': 'NUMBER',
+                                    'pattern': '#,##0'
+                                }
+                            }
+                        },
+                        'fields': 'userEnteredFormat.numberFormat'
+                    }
                 }
-                self.sheet.batchUpdate(
-                    spreadsheetId=self.spreadsheet_id,
-                    body=date_format_request
-                ).execute()
+            ]
+            batch_request = self.sheet.batchUpdate(
+                spreadsheetId=self.spreadsheet_id,
+                body={'requests': batch_requests}
+            )
 
-            print(f"새로 추가된 데이터: {len(new_rows)}개")
+            # appendCells는 반복 실행 시 행이 중복되므로 요청이 거부된 429에서만 재시도
+            for attempt in range(self.NUM_RETRIES + 1):
+                try:
+                    result = batch_request.execute()
+                    break
+                except HttpError as e:
+                    if e.resp.status != 429 or attempt == self.NUM_RETRIES:
+                        raise
+                    delay = 2 ** (attempt + 1)
+                    logger.warning(f"Sheets 요청 한도 초과 ({delay}초 후 재시도)")
+                    time.sleep(delay)
+
+            self._written_dates.update(day[0] for day in daily_data)
+            self.save_state()
+
+            logger.info(f"새로 추가된 데이터: {len(new_rows)}개")
             if duplicate_count > 0:
-                print(f"중복된 데이터: {duplicate_count}개")
+                logger.info(f"중복된 데이터: {duplicate_count}개")
 
             return result
 
         except Exception as e:
-            print(f"데이터 추가 중 오류 발생: {str(e)}")
+            logger.error(f"데이터 추가 중 오류 발생: {str(e)}")
+            # 추가 여부가 불확실하므로 다음 시도에서 스프레드시트 기준으로 다시 동기화
+            self.clear_state()
             raise
 
     def get_sheet_id(self):
         """현재 시트의 ID 조회"""
         try:
             spreadsheet = self.sheet.get(
-                spreadsheetId=self.spreadsheet_id
-            ).execute()
+                spreadsheetId=self.spreadsheet_id,
+                fields='sheets.properties(sheetId,title)'  # 시트 ID/이름만 요청
+            ).execute(num_retries=self.NUM_RETRIES)
 
             for sheet in spreadsheet['sheets']:
                 if sheet['properties']['title'] == self.sheet_name:
@@ -327,89 +579,116 @@ class GoogleSheetHandler:
             return None
 
 
-def should_collect_data():
-    """데이터 수집이 필요한지 확인"""
+RETRY_DELAYS = [60, 300, 1800]  # 연속 실패 시 재시도 대기 시간(초)
+
+
+def seconds_until_next_run():
+    """다음 수집 시각(다음 달 1일 00:05)까지 남은 시간(초)"""
     now = datetime.now()
-    return now.day == 1
+    next_month = (now.replace(day=1) + timedelta(days=32)).replace(
+        day=1, hour=0, minute=5, second=0, microsecond=0)
+    return (next_month - now).total_seconds()
 
 def main():
-    print("Cloudflare Analytics 서비스 시작...")
-    print(f"현재 시간: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-    print(" ")
-    
+    parser = argparse.ArgumentParser(description="Cloudflare Analytics 월간 수집")
+    parser.add_argument('--refresh-state', action='store_true',
+                        help="로컬 상태 파일을 무시하고 스프레드시트에서 기록된 날짜를 다시 조회")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+
+    logger.info("Cloudflare Analytics 서비스 시작...")
+
+    cf_analytics = None
     try:
         script_dir = Path(__file__).parent
         config_path = script_dir / "config.json"
         
-        print("설정 정보")
         config_handler = ConfigHandler(config_path)
         config = config_handler.config
         
-        print(f"- Config 파일 경로: {config_path}")
-        print(f"- Cloudflare Zone ID: {config['cloudflare']['zone_id']}")
-        print(f"- Spreadsheet ID: {config['google_sheets']['spreadsheet_id']}")
-        print(f"- Sheet 이름: {config['google_sheets']['sheet_name']}")
-        print(f"- Credentials 파일: {config['google_sheets']['credentials_file']}")
-        print(" ")
-    
+        logger.info(
+            "설정 정보\n"
+            f"- Config 파일 경로: {config_path}\n"
+            f"- Cloudflare Zone ID: {config['cloudflare']['zone_id']}\n"
+            f"- Spreadsheet ID: {config['google_sheets']['spreadsheet_id']}\n"
+            f"- Sheet 이름: {config['google_sheets']['sheet_name']}\n"
+            f"- Credentials 파일: {config['google_sheets']['credentials_file']}"
+        )
+
+        cf_analytics = CloudflareAnalytics(config)
+        refresh_state = args.refresh_state
+        failures = 0
+
         while True:
             try:
-                if should_collect_data():
-                    print(f"\n{datetime.now().strftime('%Y-%m-%d %H:%M:%S')} - 월간 데이터 수집 시작")
-                    
-                    print("Cloudflare 데이터 수집 중...")
-                    cf_analytics = CloudflareAnalytics(config)
-
-                    # 최근 30일 데이터 수집
-                    daily_data = cf_analytics.get_last_30days_analytics()
-                    if not daily_data:
-                        print("수집할 데이터가 없습니다.")
-                    else:
-                        print("\nGoogle Spreadsheet에 데이터 추가 중...")
-                        gsheet = GoogleSheetHandler(config)
-
-                        result = gsheet.append_daily_data(daily_data)
-                        if result:
-                            print(f"\n데이터가 성공적으로 추가되었습니다.")
-
-                            # 새로 추가된 데이터의 통계 요약
-                            total_requests = sum(day['총 요청수'] for day in daily_data)
-                            total_cached = sum(day['캐시된 요청수'] for day in daily_data)
-                            total_visitors = sum(day['고유 방문자'] for day in daily_data)
-                            total_bytes = sum(day['총 데이터(bytes)'] for day in daily_data)
-                            total_cached_bytes = sum(day['캐시된 데이터(bytes)'] for day in daily_data)
-
-                            print("\n수집 데이터 요약:")
-                            print(f"수집 기간: {daily_data[0]['날짜']} ~ {daily_data[-1]['날짜']}")
-                            print(f"총 고유 방문자: {total_visitors:,}")
-                            print(f"총 요청 수: {total_requests:,}")
-                            print(f"총 캐시된 요청 수: {total_cached:,}")
-
-                            if total_requests > 0:
-                                cache_ratio = (total_cached / total_requests) * 100
-                                print(f"전체 캐시 비율: {cache_ratio:.2f}%")
-
-                            print(f"\n총 데이터: {gsheet.format_bytes(total_bytes)}")
-                            print(f"캐시된 데이터: {gsheet.format_bytes(total_cached_bytes)}")
-
-                            if total_bytes > 0:
-                                bytes_cache_ratio = (total_cached_bytes / total_bytes) * 100
-                                print(f"데이터 캐시 비율: {bytes_cache_ratio:.2f}%")
-
-                    print("\n다음 데이터 수집까지 대기 중...")
-                
-                # 1시간마다 체크
-                time.sleep(3600)
+                logger.info("월간 데이터 수집 시작")
+
+                logger.info("Cloudflare 데이터 수집 중...")
+
+                # 최근 30일 데이터 수집과 Google Sheets 클라이언트 준비를 동시에 진행
+                with ThreadPoolExecutor(max_workers=2) as executor:
+                    daily_future = executor.submit(cf_analytics.get_last_30days_analytics)
+                    gsheet_future = executor.submit(GoogleSheetHandler, config, refresh_state=refresh_state)
+                    daily_data = daily_future.result()
+                    gsheet = gsheet_future.result()
+
+                if daily_data is None or daily_data.empty:
+                    logger.info("수집할 데이터가 없습니다.")
+                else:
+                    logger.info("Google Spreadsheet에 데이터 추가 중...")
+                    result = gsheet.append_daily_data(list(daily_data.itertuples(index=False, name=None)))
+                    refresh_state = False
+                    if result:
+                        logger.info("데이터가 성공적으로 추가되었습니다.")
+
+                        # 새로 추가된 데이터의 통계 요약
+                        totals = daily_data[[
+                            'requests', 'cachedRequests', 'uniques', 'bytes', 'cachedBytes'
+                        ]].sum()
+                        total_requests = int(totals['requests'])
+                        total_cached = int(totals['cachedRequests'])
+                        total_visitors = int(totals['uniques'])
+                        total_bytes = int(totals['bytes'])
+                        total_cached_bytes = int(totals['cachedBytes'])
+
+                        logger.info("수집 데이터 요약:")
+                        logger.info(f"수집 기간: {daily_data['date'].iloc[-1]} ~ {daily_data['date'].iloc[0]}")
+                        logger.info(f"총 고유 방문자: {total_visitors:,}")
+                        logger.info(f"총 요청 수: {total_requests:,}")
+                        logger.info(f"총 캐시된 요청 수: {total_cached:,}")
+
+                        if total_requests > 0:
+                            cache_ratio = (total_cached / total_requests) * 100
+                            logger.info(f"전체 캐시 비율: {cache_ratio:.2f}%")
+
+                        logger.info(f"총 데이터: {gsheet.format_bytes(total_bytes)}")
+                        logger.info(f"캐시된 데이터: {gsheet.format_bytes(total_cached_bytes)}")
+
+                        if total_bytes > 0:
+                            bytes_cache_ratio = (total_cached_bytes / total_bytes) * 100
+                            logger.info(f"데이터 캐시 비율: {bytes_cache_ratio:.2f}%")
+
+                logger.info("다음 데이터 수집까지 대기 중...")
+                failures = 0
+
+                # 다음 달 1일까지 대기
+                time.sleep(max(60, seconds_until_next_run()))
 
             except Exception as e:
-                print(f"\n에러 발생: {str(e)}")
-                print("1시간 후 다시 시도합니다...")
-                time.sleep(3600)
+                delay = RETRY_DELAYS[min(failures, len(RETRY_DELAYS) - 1)]
+                failures += 1
+                logger.error(f"에러 발생: {str(e)}")
+                logger.warning(f"{delay}초 후 다시 시도합니다...")
+                time.sleep(delay)
 
     except Exception as e:
-        print(f"\n에러 발생: {str(e)}")
-        print("1시간 후 다시 시도합니다...")
+        logger.error(f"에러 발생: {str(e)}")
+        logger.warning("1시간 후 다시 시도합니다...")
         time.sleep(3600)
+    finally:
+        if cf_analytics is not None:
+            cf_analytics.close()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file